@@ -1,6 +1,6 @@
 from flask import Flask, render_template, request, send_file, jsonify
 from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
@@ -9,9 +9,13 @@ from io import BytesIO
 import os
 from datetime import datetime
 import sqlite3
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+import asyncio
+import zipfile
 import json
+import math
 import re
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -22,6 +26,10 @@ NETMIND_API_KEY = os.getenv('NETMIND_API_KEY')
 NETMIND_BASE_URL = os.getenv('NETMIND_BASE_URL')
 client = OpenAI(api_key=NETMIND_API_KEY)
 
+# Upper bound on simultaneous NetMind requests made by the memo fan-out
+MEMO_FANOUT_CONCURRENCY = int(os.getenv('MEMO_FANOUT_CONCURRENCY', 8))
+MEMO_FANOUT_MAX_RECIPIENTS = 100
+
 # AI Memo Generation Class
 class MemoAI:
     def __init__(self, api_key=None, base_url=None):
@@ -33,45 +41,49 @@ class MemoAI:
             base_url=self.base_url
         )
     
+    def _build_memo_messages(self, user_prompt, sender="", recipient=""):
+        """Build the chat messages for a memo body request"""
+        system_prompt = f"""
+        You are a professional memo writer for Bishop Abiero Shaurimoyo Secondary School.
+
+        IMPORTANT: Respond ONLY with the memo body content. Do not include:
+        - Any explanations or reasoning
+        - Headers (TO, FROM, DATE, SUBJECT)
+        - Signatures or closing remarks
+        - Any meta-commentary about the memo
+
+        Write a clear, professional memo body that is:
+        - Formal and respectful in tone
+        - Specific and actionable
+        - Appropriate for school administration
+        - 2-4 paragraphs maximum"""
+        
+        user_message = f"""
+        Write the main content for a memo based on this request: {user_prompt}
+        
+        Context:
+        - This is for a secondary school environment
+        - Sender: {sender if sender else 'School Administration'}
+        - Recipient: {recipient if recipient else 'Staff/Students'}
+        
+        Output ONLY the memo content, nothing else, no headers or signatures.
+        """
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+    
     def generate_memo_content(self, user_prompt, memo_type="internal memo", sender="", recipient=""):
         """Generate memo content using NetMind API"""
         try:
             if not self.api_key:
                 raise Exception("NetMind API key not found. Please check your .env file.")
-                
-            system_prompt = f"""
-            You are a professional memo writer for Bishop Abiero Shaurimoyo Secondary School.
-
-            IMPORTANT: Respond ONLY with the memo body content. Do not include:
-            - Any explanations or reasoning
-            - Headers (TO, FROM, DATE, SUBJECT)
-            - Signatures or closing remarks
-            - Any meta-commentary about the memo
-
-            Write a clear, professional memo body that is:
-            - Formal and respectful in tone
-            - Specific and actionable
-            - Appropriate for school administration
-            - 2-4 paragraphs maximum"""
-            
-            user_message = f"""
-            Write the main content for a memo based on this request: {user_prompt}
-            
-            Context:
-            - This is for a secondary school environment
-            - Sender: {sender if sender else 'School Administration'}
-            - Recipient: {recipient if recipient else 'Staff/Students'}
-            
-            Output ONLY the memo content, nothing else, no headers or signatures.
-            """
             
             # Use NetMind API with OpenAI-compatible format
             response = self.client.chat.completions.create(
                 model="Qwen/Qwen3-8B",  # NetMind usually supports this model name
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
+                messages=self._build_memo_messages(user_prompt, sender, recipient),
                 max_tokens=800,
                 temperature=0.5
             )
@@ -117,6 +129,55 @@ class MemoAI:
         except Exception as e:
             print(f"NetMind API Error (subject generation): {str(e)}")
             return "General Communication"
+    
+    async def _generate_memo_content_async(self, async_client, semaphore, user_prompt, sender, recipient):
+        """Generate one memo body on the async client, respecting the shared concurrency limit"""
+        async with semaphore:
+            try:
+                response = await async_client.chat.completions.create(
+                    model="Qwen/Qwen3-8B",
+                    messages=self._build_memo_messages(user_prompt, sender, recipient),
+                    max_tokens=800,
+                    temperature=0.5
+                )
+                
+                return {
+                    "success": True,
+                    "content": response.choices[0].message.content.strip(),
+                    "usage": response.usage.total_tokens if hasattr(response, 'usage') else 0
+                }
+                
+            except Exception as e:
+                print(f"NetMind API Error ({recipient}): {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"NetMind API Error: {str(e)}",
+                    "content": ""
+                }
+    
+    def generate_memo_contents(self, memo_requests, max_concurrency=MEMO_FANOUT_CONCURRENCY):
+        """Generate several memo bodies concurrently using NetMind API
+        
+        memo_requests is a list of (user_prompt, sender, recipient) tuples.
+        Results are returned in the same order as the requests.
+        """
+        if not self.api_key:
+            return [{
+                "success": False,
+                "error": "NetMind API Error: NetMind API key not found. Please check your .env file.",
+                "content": ""
+            } for _ in memo_requests]
+        
+        async def generate_all():
+            semaphore = asyncio.Semaphore(max_concurrency)
+            # The async client is bound to this event loop, so it is created per batch
+            async with AsyncOpenAI(api_key=self.api_key, base_url=self.base_url) as async_client:
+                return await asyncio.gather(*(
+                    self._generate_memo_content_async(async_client, semaphore, user_prompt, sender, recipient)
+                    for user_prompt, sender, recipient in memo_requests
+                ))
+        
+        return asyncio.run(generate_all())
 
 # Initialize AI helper with NetMind API
 memo_ai = MemoAI()
@@ -124,8 +185,57 @@ memo_ai = MemoAI()
 app = Flask(__name__)
 
 # Database setup
-def init_db():
-    conn = sqlite3.connect('school_forms.db')
+# Rows are backfilled in chunks so a busy database is never locked for long
+SCHEMA_MIGRATION_CHUNK_SIZE = 500
+
+# Formats accepted for date and time fields, tried in order
+DATE_INPUT_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d', '%d.%m.%Y',
+                      '%d %B %Y', '%d %b %Y', '%B %d, %Y', '%b %d, %Y']
+TIME_INPUT_FORMATS = ['%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p', '%I %p', '%I%p']
+
+def normalize_date(value):
+    """Return a date as ISO 'YYYY-MM-DD', raising ValueError if it can't be parsed"""
+    value = str(value or '').strip()
+    for date_format in DATE_INPUT_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    # Also accept full ISO timestamps such as '2025-06-11T10:00'
+    return datetime.fromisoformat(value).strftime('%Y-%m-%d')
+
+def normalize_time(value):
+    """Return a time as 24-hour 'HH:MM', raising ValueError if it can't be parsed"""
+    value = str(value or '').strip().upper()
+    for time_format in TIME_INPUT_FORMATS:
+        try:
+            return datetime.strptime(value, time_format).strftime('%H:%M')
+        except ValueError:
+            continue
+    raise ValueError(f"time data '{value}' does not match any supported format")
+
+def normalize_form_fields(data, date_fields=(), time_fields=(), optional_fields=()):
+    """Normalize the date/time fields of a submitted form
+    
+    Returns (normalized, error): a dict of normalized values keyed by field
+    (None for an empty optional field) and an error message for the first
+    invalid field, or None. The submitted data is left untouched.
+    """
+    normalized = {}
+    for fields, normalize, example in ((date_fields, normalize_date, 'YYYY-MM-DD'),
+                                       (time_fields, normalize_time, 'HH:MM')):
+        for field in fields:
+            value = data.get(field)
+            if not value and field in optional_fields:
+                normalized[field] = None
+                continue
+            try:
+                normalized[field] = normalize(value)
+            except (TypeError, ValueError):
+                return normalized, f"Invalid value for {field}: '{value or ''}'. Expected a format like {example}"
+    return normalized, None
+
+def _migration_initial_schema(conn):
     c = conn.cursor()
     
     # Create tables for storing form data
@@ -159,10 +269,197 @@ def init_db():
                   classes TEXT,
                   special_instructions TEXT,
                   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+def _add_column_if_missing(c, table, column, column_type):
+    c.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in c.fetchall()]:
+        c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+def _migration_add_normalized_columns(conn):
+    c = conn.cursor()
+    for table, column in NORMALIZED_COLUMNS:
+        _add_column_if_missing(c, table, f'{column}_iso', 'TEXT')
+
+def _migration_backfill_normalized_columns(conn):
+    c = conn.cursor()
+    for table, column in NORMALIZED_COLUMNS:
+        normalize = normalize_time if column.endswith('_time') else normalize_date
+        last_id = 0
+        skipped = 0
+        while True:
+            c.execute(f'''SELECT id, {column} FROM {table}
+                         WHERE id > ? AND {column}_iso IS NULL
+                         ORDER BY id LIMIT ?''', (last_id, SCHEMA_MIGRATION_CHUNK_SIZE))
+            rows = c.fetchall()
+            if not rows:
+                break
+            
+            updates = []
+            for row_id, value in rows:
+                if not value:
+                    continue
+                try:
+                    updates.append((normalize(value), row_id))
+                except (TypeError, ValueError):
+                    skipped += 1
+            
+            c.executemany(f'UPDATE {table} SET {column}_iso = ? WHERE id = ?', updates)
+            # Commit each chunk so other connections can write in between
+            conn.commit()
+            last_id = rows[-1][0]
+        
+        if skipped:
+            print(f"Schema migration: left {skipped} unparseable {table}.{column} values unnormalized")
+
+def _migration_index_normalized_columns(conn):
+    c = conn.cursor()
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_leave_out_chits_leave_date_iso
+                 ON leave_out_chits (leave_date_iso, leave_time_iso)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_internal_memos_date_issued_iso
+                 ON internal_memos (date_issued_iso)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_teacher_duty_forms_duty_date_iso
+                 ON teacher_duty_forms (duty_date_iso)''')
+
+def _migration_index_memo_numbers(conn):
+    c = conn.cursor()
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_internal_memos_memo_no
+                 ON internal_memos (memo_no)''')
+
+# Free-text columns that get a normalized '<column>_iso' companion
+NORMALIZED_COLUMNS = [
+    ('leave_out_chits', 'leave_date'),
+    ('leave_out_chits', 'leave_time'),
+    ('leave_out_chits', 'return_time'),
+    ('internal_memos', 'date_issued'),
+    ('teacher_duty_forms', 'duty_date')
+]
+
+# Ordered schema migrations; append new ones, never edit applied ones
+SCHEMA_MIGRATIONS = [
+    (1, 'Create form tables', _migration_initial_schema),
+    (2, 'Add normalized date/time columns', _migration_add_normalized_columns),
+    (3, 'Backfill normalized date/time columns', _migration_backfill_normalized_columns),
+    (4, 'Index normalized date columns', _migration_index_normalized_columns),
+    (5, 'Index memo numbers', _migration_index_memo_numbers)
+]
+
+def migrate_db(conn):
+    """Apply every schema migration newer than the recorded schema version
     
+    Several processes may start at once, so each migration takes a write
+    lock and re-reads the version before running. The chunked backfill
+    releases that lock between chunks, which is safe because every
+    migration is idempotent.
+    """
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS schema_migrations
+                 (version INTEGER PRIMARY KEY,
+                  description TEXT,
+                  applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
     conn.commit()
+    
+    for version, description, migration in SCHEMA_MIGRATIONS:
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('SELECT COALESCE(MAX(version), 0) FROM schema_migrations')
+        if version <= c.fetchone()[0]:
+            conn.commit()
+            continue
+        print(f"Applying schema migration {version}: {description}")
+        migration(conn)
+        c.execute('INSERT OR IGNORE INTO schema_migrations (version, description) VALUES (?, ?)',
+                  (version, description))
+        conn.commit()
+
+def init_db():
+    # Allow time for another process to finish a migration step
+    conn = sqlite3.connect('school_forms.db', timeout=30)
+    migrate_db(conn)
     conn.close()
 
+# Apply pending migrations whenever the app is loaded, whichever server runs it
+init_db()
+
+def allocate_memo_numbers(c, count):
+    """Reserve `count` consecutive memo numbers for the current year
+    
+    Numbers continue from the highest one already stored for the year,
+    whatever date the memos carry. Call this inside the BEGIN IMMEDIATE
+    transaction that inserts the memos so that two requests can't be
+    handed the same number.
+    """
+    prefix = f"BASS/MEMO/{datetime.now().year}/"
+    # '0' sorts right after '/', so this range covers exactly the numbers with this prefix
+    c.execute('''SELECT COALESCE(MAX(CAST(SUBSTR(memo_no, ?) AS INTEGER)), 0) FROM internal_memos
+                 WHERE memo_no >= ? AND memo_no < ?''',
+              (len(prefix) + 1, prefix, prefix[:-1] + '0'))
+    start = c.fetchone()[0] + 1
+    return [f"{prefix}{number:03d}" for number in range(start, start + count)]
+
+# Change feed setup
+# Maps the public feed names used by the live boards to their tables
+CHANGE_FEEDS = {
+    'leave-chits': 'leave_out_chits',
+    'memos': 'internal_memos',
+    'duty-forms': 'teacher_duty_forms'
+}
+CHANGE_FEED_MAX_WAIT = 30  # seconds a long-poll request may be held open
+CHANGE_FEED_MAX_ROWS = 200
+
+class ChangeNotifier:
+    """Tracks the newest row id per table and wakes long-polling clients on insert.
+
+    The notifier lives in this process only. Inserts made through notify()
+    wake waiting clients immediately; inserts from other processes are
+    picked up when a wait times out and the newest id is re-read.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._latest_ids = {}
+    
+    def _load_latest_id(self, table):
+        """Read the newest id for a table (a single primary-key lookup)"""
+        conn = sqlite3.connect('school_forms.db')
+        c = conn.cursor()
+        c.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+        latest_id = c.fetchone()[0]
+        conn.close()
+        return latest_id
+    
+    def _ensure_loaded(self, table):
+        if table not in self._latest_ids:
+            self._latest_ids[table] = self._load_latest_id(table)
+    
+    def latest_id(self, table):
+        with self._condition:
+            self._ensure_loaded(table)
+            return self._latest_ids[table]
+    
+    def notify(self, table, row_id):
+        """Record a newly inserted row and wake every waiting client"""
+        with self._condition:
+            self._ensure_loaded(table)
+            self._latest_ids[table] = max(self._latest_ids[table], row_id)
+            self._condition.notify_all()
+    
+    def wait_for_change(self, table, since_id, timeout):
+        """Block until a row newer than since_id exists or timeout expires.
+
+        Returns the newest known id, which is still <= since_id if nothing
+        new was found.
+        """
+        with self._condition:
+            self._ensure_loaded(table)
+            if self._condition.wait_for(lambda: self._latest_ids[table] > since_id, timeout):
+                return self._latest_ids[table]
+        
+        # Inserts from other processes never reach the notifier, so check the database once
+        latest_id = self._load_latest_id(table)
+        with self._condition:
+            self._latest_ids[table] = max(self._latest_ids[table], latest_id)
+            return self._latest_ids[table]
+
+change_notifier = ChangeNotifier()
+
 # School Information
 SCHOOL_INFO = {
     'name': 'BISHOP ABIERO SHAURIMOYO SECONDARY SCHOOL',
@@ -289,11 +586,8 @@ def generate_leave_out_chit(data):
     buffer.seek(0)
     return buffer
 
-def generate_internal_memo(data):
-    """Generate Internal Memo PDF in proper memo format"""
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=130, leftMargin=50, rightMargin=50)
-    
+def build_internal_memo_story(data):
+    """Build the flowables for one Internal Memo"""
     styles = getSampleStyleSheet()
     
     # Custom styles for memo format
@@ -365,7 +659,40 @@ def generate_internal_memo(data):
     story.append(Paragraph(f"<b>{data['sender']}</b>", signature_style))
     story.append(Paragraph("Signature", signature_style))
     
-    doc.build(story, onFirstPage=create_banner)
+    return story
+
+def generate_internal_memo(data):
+    """Generate Internal Memo PDF in proper memo format"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=130, leftMargin=50, rightMargin=50)
+    
+    doc.build(build_internal_memo_story(data), onFirstPage=create_banner)
+    buffer.seek(0)
+    return buffer
+
+def generate_internal_memo_batch(memos):
+    """Generate a single PDF holding several Internal Memos, one per page run"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=130, leftMargin=50, rightMargin=50)
+    
+    story = []
+    for index, data in enumerate(memos):
+        if index:
+            story.append(PageBreak())
+        story.extend(build_internal_memo_story(data))
+    
+    # Every memo starts on a new page, so every page carries the banner
+    doc.build(story, onFirstPage=create_banner, onLaterPages=create_banner)
+    buffer.seek(0)
+    return buffer
+
+def generate_internal_memo_zip(memos):
+    """Generate a ZIP archive with one Internal Memo PDF per memo"""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for data in memos:
+            filename = f"internal_memo_{data['memo_no'].replace('/', '_')}.pdf"
+            archive.writestr(filename, generate_internal_memo(data).getvalue())
     buffer.seek(0)
     return buffer
 
@@ -460,16 +787,29 @@ def teacher_duty_form():
 def generate_leave_chit():
     data = request.get_json()
     
+    normalized, error = normalize_form_fields(data, date_fields=['leave_date'],
+                                              time_fields=['leave_time', 'return_time'],
+                                              optional_fields=['return_time'])
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+    
+    # Return time is optional, so default it for the insert and the PDF
+    data['return_time'] = data.get('return_time') or ''
+    
     # Save to database
     conn = sqlite3.connect('school_forms.db')
     c = conn.cursor()
     c.execute('''INSERT INTO leave_out_chits 
-                 (student_name, student_class, admission_no, leave_date, leave_time, return_time, reason)
-                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                 (student_name, student_class, admission_no, leave_date, leave_time, return_time, reason,
+                  leave_date_iso, leave_time_iso, return_time_iso)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
               (data['student_name'], data['student_class'], data['admission_no'],
-               data['leave_date'], data['leave_time'], data['return_time'], data['reason']))
+               data['leave_date'], data['leave_time'], data['return_time'], data['reason'],
+               normalized['leave_date'], normalized['leave_time'], normalized['return_time']))
     conn.commit()
+    row_id = c.lastrowid
     conn.close()
+    change_notifier.notify('leave_out_chits', row_id)
     
     # Generate PDF
     pdf_buffer = generate_leave_out_chit(data)
@@ -641,28 +981,25 @@ def get_memo_templates():
 def generate_memo():
     data = request.get_json()
     
-    # Auto-generate memo number if not provided
-    if not data.get('memo_no'):
-        current_date = datetime.now()
-        conn = sqlite3.connect('school_forms.db')
-        c = conn.cursor()
-        c.execute('SELECT COUNT(*) FROM internal_memos WHERE date_issued LIKE ?', 
-                 (f"{current_date.year}%",))
-        count = c.fetchone()[0] + 1
-        conn.close()
-        
-        data['memo_no'] = f"BASS/MEMO/{current_date.year}/{count:03d}"
+    normalized, error = normalize_form_fields(data, date_fields=['date_issued'])
+    if error:
+        return jsonify({"success": False, "error": error}), 400
     
-    # Save to database
+    # Save to database, allocating the memo number in the same transaction if not provided
     conn = sqlite3.connect('school_forms.db')
     c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    if not data.get('memo_no'):
+        data['memo_no'] = allocate_memo_numbers(c, 1)[0]
     c.execute('''INSERT INTO internal_memos 
-                 (memo_no, recipient, sender, subject, content, date_issued)
-                 VALUES (?, ?, ?, ?, ?, ?)''',
+                 (memo_no, recipient, sender, subject, content, date_issued, date_issued_iso)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
               (data['memo_no'], data['recipient'], data['sender'], 
-               data['subject'], data['content'], data['date_issued']))
+               data['subject'], data['content'], data['date_issued'], normalized['date_issued']))
     conn.commit()
+    row_id = c.lastrowid
     conn.close()
+    change_notifier.notify('internal_memos', row_id)
     
     # Generate PDF
     pdf_buffer = generate_internal_memo(data)
@@ -674,20 +1011,146 @@ def generate_memo():
         mimetype='application/pdf'
     )
 
+@app.route('/generate-memo-batch', methods=['POST'])
+def generate_memo_batch():
+    """Generate personalised memos for many recipients from one prompt
+    
+    Expects JSON with prompt, sender, date_issued, an optional subject,
+    recipients (names, or objects with recipient and optional details) and
+    an optional format of "pdf" (default, one combined file) or "zip".
+    Errors are JSON with a non-2xx status, like the other file-returning routes.
+    """
+    data = request.get_json()
+    user_prompt = data.get('prompt', '')
+    sender = data.get('sender', '')
+    recipients = data.get('recipients', [])
+    output_format = data.get('format', 'pdf')
+    
+    if not user_prompt:
+        return jsonify({
+            "success": False,
+            "error": "Please provide a prompt for memo generation"
+        }), 400
+    
+    if not isinstance(recipients, list):
+        return jsonify({
+            "success": False,
+            "error": "Recipients must be a list of names or recipient objects"
+        }), 400
+    
+    if not recipients or len(recipients) > MEMO_FANOUT_MAX_RECIPIENTS:
+        return jsonify({
+            "success": False,
+            "error": f"Please provide between 1 and {MEMO_FANOUT_MAX_RECIPIENTS} recipients"
+        }), 400
+    
+    if output_format not in ('pdf', 'zip'):
+        return jsonify({
+            "success": False,
+            "error": "Format must be either 'pdf' or 'zip'"
+        }), 400
+    
+    data['date_issued'] = data.get('date_issued') or datetime.now().strftime('%Y-%m-%d')
+    normalized, error = normalize_form_fields(data, date_fields=['date_issued'])
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+    
+    # Personalise the shared prompt with any recipient-specific details
+    memo_requests = []
+    for entry in recipients:
+        if isinstance(entry, dict):
+            recipient = entry.get('recipient')
+            details = entry.get('details') or ''
+        else:
+            recipient, details = entry, ''
+        
+        if not isinstance(recipient, str) or not recipient.strip() or not isinstance(details, str):
+            return jsonify({
+                "success": False,
+                "error": "Each recipient must be a name or an object with a recipient name and optional details"
+            }), 400
+        recipient = recipient.strip()
+        
+        prompt = f"{user_prompt}\nDetails specific to this recipient: {details}" if details else user_prompt
+        memo_requests.append((prompt, sender, recipient))
+    
+    results = memo_ai.generate_memo_contents(memo_requests)
+    
+    failed = [
+        {"recipient": recipient, "error": result["error"]}
+        for (_, _, recipient), result in zip(memo_requests, results)
+        if not result["success"]
+    ]
+    if failed:
+        return jsonify({
+            "success": False,
+            "error": f"Memo generation failed for {len(failed)} of {len(results)} recipients",
+            "failed": failed
+        }), 502
+    
+    subject = data.get('subject') or memo_ai.suggest_subject(results[0]["content"])
+    date_issued = data['date_issued']
+    
+    memos = [{
+        'recipient': recipient,
+        'sender': sender,
+        'subject': subject,
+        'content': result["content"],
+        'date_issued': date_issued
+    } for (_, _, recipient), result in zip(memo_requests, results)]
+    
+    # Allocate the memo numbers and save every memo in one transaction
+    conn = sqlite3.connect('school_forms.db')
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    row_ids = []
+    for memo, memo_no in zip(memos, allocate_memo_numbers(c, len(memos))):
+        memo['memo_no'] = memo_no
+        c.execute('''INSERT INTO internal_memos 
+                     (memo_no, recipient, sender, subject, content, date_issued, date_issued_iso)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                  (memo['memo_no'], memo['recipient'], memo['sender'],
+                   memo['subject'], memo['content'], memo['date_issued'], normalized['date_issued']))
+        row_ids.append(c.lastrowid)
+    conn.commit()
+    conn.close()
+    change_notifier.notify('internal_memos', max(row_ids))
+    
+    if output_format == 'zip':
+        return send_file(
+            generate_internal_memo_zip(memos),
+            as_attachment=True,
+            download_name="internal_memos.zip",
+            mimetype='application/zip'
+        )
+    
+    return send_file(
+        generate_internal_memo_batch(memos),
+        as_attachment=True,
+        download_name="internal_memos.pdf",
+        mimetype='application/pdf'
+    )
+
 @app.route('/generate-duty-form', methods=['POST'])
 def generate_duty_form():
     data = request.get_json()
     
+    normalized, error = normalize_form_fields(data, date_fields=['duty_date'])
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+    
     # Save to database
     conn = sqlite3.connect('school_forms.db')
     c = conn.cursor()
     c.execute('''INSERT INTO teacher_duty_forms 
-                 (teacher_name, duty_date, periods, subjects, classes, special_instructions)
-                 VALUES (?, ?, ?, ?, ?, ?)''',
+                 (teacher_name, duty_date, periods, subjects, classes, special_instructions, duty_date_iso)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
               (data['teacher_name'], data['duty_date'], data['periods'],
-               data['subjects'], data['classes'], data['special_instructions']))
+               data['subjects'], data['classes'], data['special_instructions'], normalized['duty_date']))
     conn.commit()
+    row_id = c.lastrowid
     conn.close()
+    change_notifier.notify('teacher_duty_forms', row_id)
     
     # Generate PDF
     pdf_buffer = generate_teacher_duty_form(data)
@@ -699,12 +1162,63 @@ def generate_duty_form():
         mimetype='application/pdf'
     )
 
+@app.route('/changes/<feed>', methods=['GET'])
+def get_changes(feed):
+    """Return rows newer than the client's cursor, long-polling until some arrive.
+
+    Query parameters:
+    - since: last id the client has seen (default 0)
+    - wait: seconds to hold the request open when nothing is new (default 0)
+    - limit: maximum rows to return (default and cap CHANGE_FEED_MAX_ROWS)
+    """
+    table = CHANGE_FEEDS.get(feed)
+    if not table:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown feed '{feed}'. Available feeds: {', '.join(CHANGE_FEEDS)}"
+        }), 404
+    
+    try:
+        since_id = max(int(request.args.get('since', 0)), 0)
+        wait = float(request.args.get('wait', 0))
+        # NaN slips through min/max and would make the wait below never time out
+        if not math.isfinite(wait):
+            raise ValueError(f"non-finite wait: {wait}")
+        wait = min(max(wait, 0), CHANGE_FEED_MAX_WAIT)
+        limit = min(max(int(request.args.get('limit', CHANGE_FEED_MAX_ROWS)), 1), CHANGE_FEED_MAX_ROWS)
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "'since' and 'limit' must be integers and 'wait' a number of seconds"
+        }), 400
+    
+    # Waiting happens on the in-process notifier, so idle clients never touch the database
+    latest_id = change_notifier.wait_for_change(table, since_id, wait)
+    if latest_id <= since_id:
+        return jsonify({
+            "success": True,
+            "feed": feed,
+            "changes": [],
+            "cursor": since_id
+        })
+    
+    conn = sqlite3.connect('school_forms.db')
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute(f'SELECT * FROM {table} WHERE id > ? ORDER BY id LIMIT ?', (since_id, limit))
+    changes = [dict(row) for row in c.fetchall()]
+    conn.close()
+    
+    return jsonify({
+        "success": True,
+        "feed": feed,
+        "changes": changes,
+        "cursor": changes[-1]['id'] if changes else since_id
+    })
+
 if __name__ == '__main__':
     # Create templates directory if it doesn't exist
     if not os.path.exists('templates'):
         os.makedirs('templates')
     
-    # Initialize database
-    init_db()
-    
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file